@@ -1,8 +1,18 @@
 
 import streamlit as st
-import pandas as pd
-import io
-from datetime import datetime, timedelta
+import numpy as np
+import hashlib
+import plotly.graph_objects as go
+
+import apr_core
+
+
+def _plot_chart(key: str, trace_type, x, y, name: str):
+    # A stable key lets the browser patch the existing plot instead of remounting it
+    fig = go.Figure(trace_type(x=x, y=y, name=name))
+    fig.update_layout(margin=dict(l=0, r=0, t=10, b=0), yaxis_title=name)
+    st.plotly_chart(fig, key=key, width="stretch")
+
 
 st.title("📈 Isolated Funding Rate APR Viewer (v10.3)")
 
@@ -22,11 +32,16 @@ uploaded_file = st.file_uploader("Upload funding file (.csv or .xlsx)", type=["c
 if uploaded_file:
     exchange = st.selectbox("Select Exchange", ["Bybit", "WOOX", "Other"])
 
-    # Read file
-    if uploaded_file.name.endswith(".csv"):
-        df = pd.read_csv(uploaded_file)
-    else:
-        df = pd.read_excel(uploaded_file)
+    # Read file once per upload; reruns reuse the parsed frame from session state
+    data = uploaded_file.getvalue()
+    h = hashlib.blake2b(digest_size=8)
+    h.update(uploaded_file.name.encode())
+    h.update(data)
+    upload_hash = h.hexdigest()
+    if st.session_state.get('df_hash') != upload_hash:
+        st.session_state['df'] = apr_core.load(uploaded_file.name, data)
+        st.session_state['df_hash'] = upload_hash
+    df = st.session_state['df']
 
     st.write("📄 Raw Data Preview:", df.head())
     st.write("📌 Columns detected:", list(df.columns))
@@ -34,31 +49,26 @@ if uploaded_file:
     time_col = st.selectbox("🕒 Select Timestamp Column", options=df.columns)
     funding_col = st.selectbox("💸 Select Funding Rate Column", options=df.columns)
 
-    df[time_col] = pd.to_datetime(df[time_col], errors='coerce')
-    df = df.dropna(subset=[time_col])
-    df = df.sort_values(by=time_col)
+    df = apr_core.parse_times(df, time_col)
 
-    if len(df) > 1:
-        detected_interval = (df[time_col].iloc[1] - df[time_col].iloc[0]).total_seconds() / 3600
+    # Median spacing is robust to missing rows, unlike the first gap alone
+    ts = apr_core.wall_clock(df[time_col]).to_numpy('datetime64[s]')
+    if ts.size > 1:
+        detected_interval = float(np.median(np.diff(ts).astype('int64'))) / 3600
     else:
         detected_interval = 4
     interval_hours = st.number_input("⏱ Funding Interval (Hours)", value=round(detected_interval), step=1)
 
     funding_format = st.radio("💱 Funding Rate Format", ["Decimal (e.g. 0.0001)", "Percent (e.g. 0.01%)"])
 
-    df[funding_col] = df[funding_col].astype(str).str.replace('%', '', regex=False)
-    df[funding_col] = pd.to_numeric(df[funding_col], errors='coerce')
-    df = df.dropna(subset=[funding_col])
-
-    if funding_format == "Percent (e.g. 0.01%)":
-        df[funding_col] = df[funding_col] / 100
-
-    df['Funding (%)'] = df[funding_col] * 100
-    df['APR (%)'] = df[funding_col] * (365 * 24 / interval_hours) * 100
+    df = apr_core.clean(df, funding_col, funding_format)
+    apr_factor = (365 * 24 / interval_hours) * 100
+    df['APR (%)'] = df[funding_col].to_numpy() * apr_factor
 
     days = st.number_input("📆 Select APR Timeframe (1-90 days)", min_value=1, max_value=90, value=30)
-    cutoff_time = df[time_col].max() - timedelta(days=days)
-    df_filtered = df[df[time_col] >= cutoff_time]
+    df_filtered, avg_funding_rate, annualized_apr_clean, average_apr_legacy = apr_core.apr_summary(
+        df, time_col, funding_col, days
+    )
 
     # --- Row count validator ---
     expected_rows = int((24 / interval_hours) * days)
@@ -66,73 +76,48 @@ if uploaded_file:
     if actual_rows < expected_rows:
         st.warning(f"⚠️ Only {actual_rows} rows found in timeframe — expected ~{expected_rows}. Results may be less reliable.")
 
-    avg_funding_rate = df_filtered[funding_col].mean()
-    annualized_apr_clean = avg_funding_rate * 365 * 24 * 100
-    average_apr_legacy = df_filtered["APR (%)"].mean()
-
     st.subheader(f"📌 APR Summary for Last {days} Days")
     st.metric(label="📈 Website-Style APR (preferred)", value=f"{annualized_apr_clean:.2f}%", help="Based on average funding rate × 8760 × 100")
     st.metric(label="🧮 Average of Interval APRs", value=f"{average_apr_legacy:.2f}%", help="Average of each row's APR (legacy method)")
 
+    # Extract the shared chart arrays once; plotted series go out as float32 to halve
+    # the payload, while the color buckets keep full precision
+    times = df_filtered[time_col].to_numpy()
+    apr = df_filtered['APR (%)'].to_numpy()
+    apr_chart = apr.astype(np.float32)
+
     # Plot APR chart
     st.subheader("📈 APR (%) Over Time")
-    st.line_chart(df_filtered.set_index(time_col)['APR (%)'])
+    _plot_chart('apr_fig', go.Scattergl, times, apr_chart, 'APR (%)')
 
     # Visual Squares with daily separator
     st.subheader("🟦 APR Threshold Squares")
-    def apr_to_color(apr):
-        if apr > 100:
-            return "green"
-        elif apr < -100:
-            return "red"
-        elif apr < 1:
-            return "orange"
-        else:
-            return "blue"
-
-    colors = df_filtered['APR (%)'].apply(apr_to_color)
-    dates = df_filtered[time_col].dt.date.tolist()
-    square_html = ""
-    last_day = None
-    for color, day in zip(colors, dates):
-        if last_day is not None and day != last_day:
-            square_html += "<span style='display:inline-block;width:4px;height:10px;margin:1px;background:none;'>-</span>"
-        square_html += f"<span style='display:inline-block;width:10px;height:10px;margin:1px;background:{color};border-radius:2px;'></span>"
-        last_day = day
-    st.markdown(square_html, unsafe_allow_html=True)
+    dates = apr_core.wall_clock(df_filtered[time_col]).to_numpy('datetime64[D]')
+    day_change = np.concatenate(([False], dates[1:] != dates[:-1]))
+    st.markdown(apr_core.squares_html(apr_core.square_colors(apr), day_change), unsafe_allow_html=True)
 
     st.subheader("💹 Funding Rate (%) Over Time")
-    st.line_chart(df_filtered.set_index(time_col)['Funding (%)'])
+    _plot_chart('funding_fig', go.Scattergl, times, df_filtered['Funding (%)'].to_numpy(np.float32), 'Funding (%)')
 
     st.subheader("📊 APR Per Funding Interval")
-    st.bar_chart(df_filtered.set_index(time_col)['APR (%)'])
+    _plot_chart('apr_interval_fig', go.Bar, times, apr_chart, 'APR (%)')
 
     # --- Export CSVs ---
-    output = io.BytesIO()
-    df.to_csv(output, index=False)
     st.download_button(
         label="📤 Download CSV with APR",
-        data=output.getvalue(),
+        data=apr_core.to_csv(df),
         file_name=f"{exchange.lower()}_with_apr.csv",
         mime="text/csv"
     )
 
     # --- Logic snapshot CSV ---
-    logic_df = pd.DataFrame({
-        "Exchange": [exchange],
-        "Funding Interval (H)": [interval_hours],
-        "APR Timeframe (Days)": [days],
-        "Funding Format": [funding_format],
-        "Funding Rows Used": [actual_rows],
-        "Expected Rows": [expected_rows],
-        "Website-Style APR": [annualized_apr_clean],
-        "Legacy APR Avg": [average_apr_legacy],
-    })
-    logic_buf = io.BytesIO()
-    logic_df.to_csv(logic_buf, index=False)
+    logic_csv = apr_core.logic_csv(
+        exchange, interval_hours, days, funding_format,
+        actual_rows, expected_rows, annualized_apr_clean, average_apr_legacy,
+    )
     st.download_button(
         label="📄 Download APR Logic Summary",
-        data=logic_buf.getvalue(),
+        data=logic_csv,
         file_name=f"{exchange.lower()}_apr_logic_summary.csv",
         mime="text/csv"
     )
@@ -0,0 +1,114 @@
+"""Cached load/clean/aggregate helpers for the funding rate APR viewer."""
+
+import io
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+try:
+    from python_calamine import CalamineError
+except ImportError:
+    CalamineError = ValueError
+
+
+def load(name: str, data: bytes) -> pd.DataFrame:
+    # Not cached: the app keeps the parsed frame in session state per upload.
+    # CSV stays on the C engine: Arrow's reader converts offset timestamps to UTC.
+    # Excel prefers the Rust calamine reader, falling back to openpyxl.
+    if name.endswith(".csv"):
+        return pd.read_csv(io.BytesIO(data))
+    try:
+        return pd.read_excel(io.BytesIO(data), engine='calamine')
+    except (ImportError, ValueError, CalamineError):
+        return pd.read_excel(io.BytesIO(data))
+
+
+# APR buckets for the threshold squares: < -100 red, < 1 orange, <= 100 blue, > 100 green
+SQUARE_BINS = np.array([-100.0, 1.0, np.nextafter(100.0, np.inf)])
+SQUARE_PALETTE = np.array(["red", "orange", "blue", "green"])
+
+
+def wall_clock(times: pd.Series) -> pd.Series:
+    # numpy datetime64 has no timezone, so drop any tz while keeping local wall time
+    return times.dt.tz_localize(None) if times.dt.tz is not None else times
+
+
+@st.cache_data(show_spinner=False)
+def parse_times(df: pd.DataFrame, time_col: str) -> pd.DataFrame:
+    df = df.copy()
+    df[time_col] = pd.to_datetime(df[time_col], errors='coerce')
+    df = df.dropna(subset=[time_col])
+    return df.sort_values(by=time_col)
+
+
+@st.cache_data(show_spinner=False)
+def clean(df: pd.DataFrame, funding_col: str, funding_format: str) -> pd.DataFrame:
+    df = df.copy()
+    col = df[funding_col]
+    if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        df[funding_col] = col.astype('float64', copy=False)
+    else:
+        # Strip '%' once on an Arrow-backed string array instead of Python object strings
+        col = col.astype('string[pyarrow]').str.replace('%', '', regex=False)
+        df[funding_col] = pd.to_numeric(col, errors='coerce').astype('float64')
+    df.dropna(subset=[funding_col], inplace=True)
+
+    if funding_format == "Percent (e.g. 0.01%)":
+        df[funding_col] = df[funding_col] / 100
+
+    df['Funding (%)'] = df[funding_col].to_numpy() * 100.0
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def apr_summary(df: pd.DataFrame, time_col: str, funding_col: str, days: int):
+    # Frame is sorted by time in parse_times, so the cutoff is a binary search + slice
+    cutoff_time = df[time_col].max() - timedelta(days=days)
+    start = df[time_col].searchsorted(cutoff_time, side='left')
+    # funding_col may itself be 'Funding (%)' or 'APR (%)' when re-reading an export
+    columns = list(dict.fromkeys([time_col, funding_col, 'Funding (%)', 'APR (%)']))
+    df_filtered = df.iloc[start:][columns]
+    avg_funding_rate = df_filtered[funding_col].mean()
+    annualized_apr_clean = avg_funding_rate * 365 * 24 * 100
+    average_apr_legacy = df_filtered['APR (%)'].mean()
+    return df_filtered, avg_funding_rate, annualized_apr_clean, average_apr_legacy
+
+
+@st.cache_data(show_spinner=False)
+def to_csv(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode('utf-8')
+
+
+@st.cache_data(show_spinner=False)
+def logic_csv(
+    exchange: str, interval_hours: float, days: int, funding_format: str,
+    actual_rows: int, expected_rows: int, annualized_apr_clean: float, average_apr_legacy: float,
+) -> bytes:
+    logic_df = pd.DataFrame({
+        "Exchange": [exchange],
+        "Funding Interval (H)": [interval_hours],
+        "APR Timeframe (Days)": [days],
+        "Funding Format": [funding_format],
+        "Funding Rows Used": [actual_rows],
+        "Expected Rows": [expected_rows],
+        "Website-Style APR": [annualized_apr_clean],
+        "Legacy APR Avg": [average_apr_legacy],
+    })
+    return logic_df.to_csv(index=False).encode('utf-8')
+
+
+def square_colors(apr: np.ndarray) -> np.ndarray:
+    return SQUARE_PALETTE[np.digitize(apr, SQUARE_BINS)]
+
+
+def squares_html(colors, day_change) -> str:
+    square = "<span style='display:inline-block;width:10px;height:10px;margin:1px;background:{};border-radius:2px;'></span>"
+    separator = "<span style='display:inline-block;width:4px;height:10px;margin:1px;background:none;'>-</span>"
+    parts = []
+    for color, new_day in zip(colors, day_change):
+        if new_day:
+            parts.append(separator)
+        parts.append(square.format(color))
+    return "".join(parts)